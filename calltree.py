@@ -18,20 +18,36 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
 import re
+import sys
+import mmap
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 
-from random import randint
+from matplotlib.collections import PatchCollection
+from matplotlib.patches import Rectangle
+
+from collections import namedtuple
 from node import Node
 from tree import Tree
 
 (_ROOT, _DEPTH, _BREADTH) = range(3)
 
+# the label associated with each call tree node, see CallTree
+Label = namedtuple('Label', ['level', 'time', 'calls', 'name'])
+
+# lines of the calltree table that contain no letters (e.g., the separators) are skipped
+_has_alpha = re.compile(r'[A-Z]', re.I).search
+
+# the form of a number that can be converted to a float, e.g., 8.203082 or 1.0
+_is_number = re.compile(r'\A[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?\Z').match
+
 """
 Objects of the call tree class encode the call paths stemming from a
 defined root function. The nodes of the tree represent function calls;
-associated with each node is a label dictionary that records pertinent
+associated with each node is a label (see Label) that records pertinent
 info, such as the inclusive time spent within the function (usually expressed
 as a fraction of the inclusive time recorded for the root function), the
 number of times the function was called, the level of the function call within
@@ -52,6 +68,15 @@ class CallTree(Tree):
         self.__level_max = self.__level_min
         self.__calls_min = 1.0
         self.__calls_max = self.__calls_min
+        self.__node_index = {}
+        self.__node_parents = np.empty(0, dtype=np.int32)
+        self.__node_levels = np.empty(0, dtype=np.int16)
+        self.__node_times = np.empty(0, dtype=np.float64)
+        self.__node_calls = np.empty(0, dtype=np.float64)
+        self.__node_offsets = np.empty(0, dtype=np.float64)
+        self.__node_names = []
+        self.__node_children_ptr = np.zeros(1, dtype=np.int32)
+        self.__node_children_idx = np.empty(0, dtype=np.int32)
 
     @property
     def root_id(self):
@@ -81,52 +106,136 @@ class CallTree(Tree):
     def calls_max(self, value):
         self.__calls_max = value
 
+    @property
+    def node_parents(self):
+        return self.__node_parents
+
+    @property
+    def node_levels(self):
+        return self.__node_levels
+
+    @property
+    def node_times(self):
+        return self.__node_times
+
+    @property
+    def node_calls(self):
+        return self.__node_calls
+
+    @property
+    def node_offsets(self):
+        return self.__node_offsets
+
+    @property
+    def node_names(self):
+        return self.__node_names
+
+    @property
+    def node_children_ptr(self):
+        return self.__node_children_ptr
+
+    @property
+    def node_children_idx(self):
+        return self.__node_children_idx
+
+
+    """
+    The nodes of a call tree are identified by integers. For compatibility with earlier
+    versions, in which the identifiers were strings, a string identifier is also accepted.
+    """
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = int(key)
+        return Tree.__getitem__(self, key)
+
 
     """
     Traverse the call tree and print out the details of each node visited.
     """
     def show(self):
-        for node in self.traverse(str(self.root_id), mode=_BREADTH):
+        for node in self.traverse(self.root_id, mode=_BREADTH):
             node.display()
 
 
+    """
+    Gather the labels of all nodes into parallel arrays (parent index, level, time,
+    calls, offset and name), where each node is indexed by the order in which it was
+    added to the tree. The root node has index zero and, as the call tree is imported
+    line by line, a parent node always has a lower index than any of its children.
+    The children of all nodes are also held in compressed form: the children of the
+    node at index i are node_children_idx[node_children_ptr[i]:node_children_ptr[i+1]],
+    listed in the order that they were added.
+    The time offsets are then computed, see _compute_offsets.
+    This method should be called once the tree has been fully built.
+    """
+    def _finalize(self):
+        nodes = list(self.nodes.values())
+        node_cnt = len(nodes)
+
+        self.__node_index = {node.identifier: i for i, node in enumerate(nodes)}
+
+        self.__node_parents = np.fromiter((-1 if None == node.parent else self.__node_index[node.parent] for node in nodes),
+                                          dtype=np.int32, count=node_cnt)
+        self.__node_levels = np.fromiter((node.label.level for node in nodes), dtype=np.int16, count=node_cnt)
+        self.__node_times = np.fromiter((node.label.time for node in nodes), dtype=np.float64, count=node_cnt)
+        self.__node_calls = np.fromiter((node.label.calls for node in nodes), dtype=np.float64, count=node_cnt)
+        self.__node_offsets = np.zeros(node_cnt, dtype=np.float64)
+        self.__node_names = [node.label.name for node in nodes]
+
+        has_parent = self.__node_parents >= 0
+        child_cnts = np.bincount(self.__node_parents[has_parent], minlength=node_cnt)
+        self.__node_children_ptr = np.concatenate(([0], np.cumsum(child_cnts))).astype(np.int32)
+        self.__node_children_idx = np.argsort(self.__node_parents, kind='stable')[node_cnt-np.count_nonzero(has_parent):].astype(np.int32)
+
+        self._compute_offsets()
+
+
     """
     A time offset is simply the horizontal position of a bar representing
     some call. The offset will depend on the amount of exclusive time belonging
     to the parent, the ordering of the call with respect to its siblings (i.e.,
     where the call id appears within the parent_node.children array), and the
     parent offset.
+    The offsets of all sibling calls are found together from the compressed children
+    arrays (see _finalize), after which the offsets are accumulated one level at a time.
     """
-    def get_time_offset(self, node):
-        node_id = node.identifier
-        parent_id = node.parent
-        
-        if None == parent_id:
-            offset = 0.0
-        else:
-            parent_node = self[parent_id]
-            child_time = 0.0
-            for child_id in parent_node.children:
-                
-                if child_id is node_id:
-                    child_offset = child_time
+    def _compute_offsets(self):
+        parents = self.node_parents
+        levels = self.node_levels
+        times = self.node_times
+        children = self.node_children_idx
 
-                child_node = self[child_id]    
-                child_time += float(child_node.label['time'])
+        child_parents = parents[children]
+        child_times = times[children]
 
-            offset = parent_node.label['offset']
-            offset += (float(parent_node.label['time']) - child_time)/2.0
-            offset += child_offset
+        # the offset of the first child relative to its parent is half the parent's exclusive time
+        first_offsets = (times - np.bincount(child_parents, weights=child_times, minlength=len(parents)))/2.0
 
-        node.label['offset'] = offset
-        
-        return offset
+        # each subsequent child is shifted by the times of the preceding siblings
+        preceding_times = np.cumsum(child_times) - child_times
+        preceding_times -= preceding_times[self.node_children_ptr[child_parents]]
+
+        relative_offsets = np.zeros(len(parents), dtype=np.float64)
+        relative_offsets[children] = first_offsets[child_parents] + preceding_times
+
+        offsets = self.__node_offsets
+        offsets[levels == self.level_min] = 0.0
+        for level in np.unique(levels[levels > self.level_min]):
+            at_level = (levels == level)
+            offsets[at_level] = offsets[parents[at_level]] + relative_offsets[at_level]
+
+
+    """
+    Return the time offset of the given node, see _compute_offsets.
+    """
+    def get_time_offset(self, node):
+        return float(self.node_offsets[self.__node_index[node.identifier]])
     
 
     """
     Plot the call tree as a flame plot. The bars within the flame plot can be cloured randomly from
     a defined palette of red-orange hues or the bars can be coloured according to the value of a specific
-    property (e.g., number of calls) that is stored in the label dictionary associated with each tree node.
+    property (e.g., number of calls) that is stored in the label associated with each tree node.
     """      
     def plot(self, title, colour_border='white', colour_property=None):
 
@@ -139,47 +248,55 @@ class CallTree(Tree):
         xmin = self.level_min - half_width
         xmax = self.level_max + half_width           
         ymin = 0.0
-        ymax = float(self[str(self.root_id)].label['time'])
+        ymax = float(self.node_times[0])
 
-        colour_incr = (self.calls_max - self.calls_min + 1) / float(len(palette))
+        palette_cnt = len(palette)
+
+        # the range of values covered by each palette colour, which must not be zero
+        colour_incr = max(self.calls_max - self.calls_min + 1, 1.0e-12) / float(palette_cnt)
 
         fig = plt.figure()
 
-        desc = []
-        x = []
-        y = []
-        colour = []
-        offset = []
-                
-        for node in self.traverse(str(self.root_id), mode=_BREADTH):
-            label = node.label
-
-            tm = round(float(label['time']), 3)
-            desc += [label['level'] + ": " + label['name'] + '(' + label['calls'] + ') - ' + str(tm) + '.']
-            
-            x += [int(label['level'])]
-            y += [float(label['time'])]
-
-            if None == colour_property:
-                colour += [palette[randint(0,len(palette)-1)]]
-            else:
-                colour_prop = float(label[colour_property])
-            
-                palette_index = int(colour_prop/colour_incr)
-                if palette_index > len(palette)-1:
-                    palette_index = -1
-            
-                colour += [palette[palette_index]]
-            
-            offset += [self.get_time_offset(node)]
-            
-
-        bar = plt.barh(tuple(x), tuple(y), height=width, color=colour, edgecolor=colour_border, left=tuple(offset), align='center')
-        bar_tooltip = [None]*len(desc)
-        
-        plt.xlim(ymin,ymax)            
+        x = self.node_levels
+        y = self.node_times
+        offset = self.node_offsets
+
+        bar_cnt = len(x)
+
+        if None == colour_property:
+            palette_index = np.random.randint(0, palette_cnt, size=bar_cnt)
+        else:
+            colour_prop = {'level': x, 'time': y, 'calls': self.node_calls, 'offset': offset}[colour_property]
+            palette_index = np.clip((colour_prop/colour_incr).astype(np.intp), 0, palette_cnt-1)
+
+        # the bars are grouped by colour, such that each group is drawn as a single collection
+        ax = fig.gca()
+        bar_corners = list(zip(offset.tolist(), (x - half_width).tolist()))
+        bar_lengths = y.tolist()
+        for i in np.unique(palette_index).tolist():
+            bar_rects = [Rectangle(bar_corners[j], bar_lengths[j], width) for j in np.flatnonzero(palette_index == i).tolist()]
+            ax.add_collection(PatchCollection(bar_rects, facecolor=palette[i], edgecolor=colour_border))
+
+        # for each level, hold the bars in order of increasing offset, so that
+        # a click can be resolved to a bar by a binary search
+        level_bars = {}
+        level_left = {}
+        level_right = {}
+        for level in np.unique(x):
+            bars = np.flatnonzero(x == level)
+            bars = bars[np.argsort(offset[bars], kind='stable')]
+            level_bars[level] = bars
+            level_left[level] = offset[bars]
+            level_right[level] = offset[bars] + y[bars]
+
+        # the tooltip texts are only formatted when a bar is first clicked
+        bar_desc = [None]*bar_cnt
+        bar_tooltip = [None]*bar_cnt
+        bar_tooltip_visible = set()
+
+        plt.xlim(ymin,ymax)
         plt.ylim(xmin,xmax)
-        fig.gca().yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+        ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
 
         plt.xlabel('Normalised Time')
         plt.ylabel('Call Stack Level')
@@ -195,44 +312,52 @@ class CallTree(Tree):
         """
         def on_bar_click(event):
             RIGHT_CLICK = 3
-            bar_clicked = False
-            
-            for i in range(len(bar_tooltip)):
-                if bar[i].contains(event)[0]:
-                    bar_clicked = True
-                    print(desc[i])
-                    if None == bar_tooltip[i]:
-                        bar_tooltip[i] = plt.text(event.xdata, event.ydata, desc[i], bbox=dict(facecolor='white', alpha=1.0))
-                    else:
-                        if bar_tooltip[i].get_visible():
-                            
-                            if RIGHT_CLICK == event.button:
-                                ax = fig.gca()
-                                data_origin = [ax.get_xlim()[0], ax.get_ylim()[0]]
-                                display_origin = ax.transData.transform((xmin, ymin))
-                                
-                                inv = ax.transData.inverted()
-                                tooltip_width = bar_tooltip[i].get_bbox_patch().get_width()
-                                data_shift = inv.transform((tooltip_width,display_origin[1]))
-                                
-                                bar_tooltip[i].set_position((event.xdata-(data_shift[0]-data_origin[0]),event.ydata))
-                            else:
-                                bar_tooltip[i].set_visible(False)
-                           
+
+            i = None
+            if None != event.xdata and None != event.ydata:
+                level = int(round(event.ydata))
+                if level in level_bars:
+                    j = np.searchsorted(level_left[level], event.xdata, side='right') - 1
+                    if j >= 0 and event.xdata <= level_right[level][j]:
+                        i = level_bars[level][j]
+
+            if None != i:
+                if None == bar_desc[i]:
+                    tm = round(float(y[i]), 3)
+                    bar_desc[i] = str(int(x[i])) + ": " + self.node_names[i] + '(' + str(float(self.node_calls[i])) + ') - ' + str(tm) + '.'
+
+                print(bar_desc[i])
+                if None == bar_tooltip[i]:
+                    bar_tooltip[i] = plt.text(event.xdata, event.ydata, bar_desc[i], bbox=dict(facecolor='white', alpha=1.0))
+                    bar_tooltip_visible.add(i)
+                else:
+                    if bar_tooltip[i].get_visible():
+
+                        if RIGHT_CLICK == event.button:
+                            data_origin = [ax.get_xlim()[0], ax.get_ylim()[0]]
+                            display_origin = ax.transData.transform((xmin, ymin))
+
+                            inv = ax.transData.inverted()
+                            tooltip_width = bar_tooltip[i].get_bbox_patch().get_width()
+                            data_shift = inv.transform((tooltip_width,display_origin[1]))
+
+                            bar_tooltip[i].set_position((event.xdata-(data_shift[0]-data_origin[0]),event.ydata))
                         else:
-                            bar_tooltip[i].set_position((event.xdata,event.ydata))
-                            bar_tooltip[i].set_visible(True)
-                    
-                    fig.canvas.draw_idle()
-                    break
-                
-
-            if not bar_clicked:
-                for i in range(len(bar_tooltip)):
-                    if None != bar_tooltip[i]:
-                        bar_tooltip[i].set_visible(False)
-                fig.canvas.draw_idle()
-                        
+                            bar_tooltip[i].set_visible(False)
+                            bar_tooltip_visible.discard(i)
+
+                    else:
+                        bar_tooltip[i].set_position((event.xdata,event.ydata))
+                        bar_tooltip[i].set_visible(True)
+                        bar_tooltip_visible.add(i)
+
+            else:
+                for i in bar_tooltip_visible:
+                    bar_tooltip[i].set_visible(False)
+                bar_tooltip_visible.clear()
+
+            fig.canvas.draw_idle()
+
         fig.canvas.mpl_connect('button_press_event', on_bar_click)
          
 
@@ -262,132 +387,103 @@ class CrayPATCallTree(CallTree):
     def import_pat_report(self, reportfile_name, calltree_title, rootfunc_name):
 
         """
-        This inner function converts a raw string label into a dictionary with
-        the following properties, offset (the x-coordinate for the left side of
-        the box representing the call), level (the position of the call within
-        the stack trace), time (the time spent within the call) and name.
+        This inner function splits a raw string label into the strings that give
+        the level (the position of the call within the stack trace), the time (the
+        time spent within the call), the number of calls and the name.
         """
         def import_label(raw_label):
-            raw_label = raw_label.replace('|', ' ')
-            raw_cols = [0.0] + raw_label.split()
-
-            items = {'offset': 0, 'level': 1, 'time': 3, 'calls': 4, 'name': -1}
+            raw_cols = raw_label.replace('|', ' ').split()
+            col_cnt = len(raw_cols)
 
-            calls_index = items['calls']
-            if calls_index < len(raw_cols):
-                raw_calls = raw_cols[calls_index]
-                raw_cols[calls_index] = raw_calls.replace(',','')
-            
-            item_keys = list(items.keys())
-            item_vals = list(items.values())
-
-            return {item_keys[item_vals.index(i)]: (raw_cols[i] if i < len(raw_cols) else "") for i in item_vals}
+            # the columns are the level, time%, time, calls and name; the names
+            # recur throughout a report and so these strings are interned
+            return (raw_cols[0],
+                    raw_cols[2] if col_cnt > 2 else "",
+                    raw_cols[3].replace(',','') if col_cnt > 3 else "",
+                    sys.intern(raw_cols[-1]))
 
         """
-        Return true if time_str can be converted to a float, which
+        Return true if time_str has the form of a number, which
         for now is assumed to be a sufficient test for a valid time string.
         """
         def is_time(time_str):
-            try:
-                float(time_str)
-                return True
-            except:
-                return False
+            return None != _is_number(time_str)
 
         """
-        Return true if calls_str can be converted to a float, which
+        Return true if calls_str has the form of a number, which
         for now is assumed to be a sufficient test for a valid call count string.
         """
         def is_calls(calls_str):
-            try:
-                float(calls_str)
-                return True
-            except:
-                return False
-        
-        calltree_srch = True
-        rootfunc_srch = True
-
+            return None != _is_number(calls_str)
         
         root_level = 0
         root_time = 0.0
-        levels = []
-        ids = []
-        node_cnt = self.root_id
+        call_path = []
+        node_id = self.root_id
 
-        fin = open(reportfile_name, 'r')
-        
-        for line in fin:
-
-            if calltree_srch:
-                
-                calltree_srch = (-1 == line.find(calltree_title))
-                
-            elif rootfunc_srch:
-                
-                rootfunc_srch = (-1 == line.find(rootfunc_name))
-
-                if not rootfunc_srch:
-                    label = import_label(line)
-
-                    root_level = int(label['level'])
-                    levels.append(self.level_min)
-                    label['level'] = str(levels[-1])
-
-                    root_time = float(label['time'])
-                    label['time'] = '1.0'
-                    
-                    if not is_calls(label['calls']):
-                        label['calls'] = '1.0'
-                                        
-                    ids.append(str(node_cnt))
-                    self.add_node(ids[-1], label)
-        
-            else:
-                
-                if None == re.search(r'[A-Z]+', line, re.I):
-                    continue
+        with open(reportfile_name, 'rb') as fin:
+            # an empty report holds no calltree, nor can it be memory-mapped
+            if 0 != os.fstat(fin.fileno()).st_size:
+                with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as report:
+                    # search the raw bytes of the report for the root function, which is the first
+                    # occurrence of the root function name after the line holding the calltree title
+                    rootfunc_pos = -1
+                    calltree_pos = report.find(calltree_title.encode())
+                    if -1 != calltree_pos:
+                        calltree_end = report.find(b'\n', calltree_pos)
+                        if -1 != calltree_end:
+                            rootfunc_pos = report.find(rootfunc_name.encode(), calltree_end)
 
-                if -1 != line.find('(exclusive)'):
-                    continue
+                    if -1 != rootfunc_pos:
+                        report.seek(report.rfind(b'\n', 0, rootfunc_pos) + 1)
 
-                label = import_label(line)
+                        raw_level, raw_time, raw_calls, name = import_label(report.readline().decode())
 
-                level = int(label['level']) - root_level+1
-                if level == levels[0]:
-                    break
+                        root_level = int(raw_level)
+                        root_time = float(raw_time)
 
-                parent_id = ids[0]
-                for i, lv in enumerate(reversed(levels)):
-                    if level == lv+1:
-                        parent_id = ids[-1-i]
-                        break 
+                        calls = float(raw_calls) if is_calls(raw_calls) else 1.0
 
-                if level > self.level_max:
-                    self.level_max = level
-                    
-                levels.append(level)
-                label['level'] = str(levels[-1])
+                        self.add_node(node_id, Label(self.level_min, 1.0, calls, name))
+                        call_path.append((self.level_min, node_id))
 
-                node_cnt += 1
-                ids.append(str(node_cnt))
+                        for raw_line in iter(report.readline, b''):
+                            line = raw_line.decode()
 
-                if is_time(label['time']):
-                    label['time'] = str(float(label['time'])/root_time)
-                else:
-                    label['time'] = self[parent_id].label['time']
-                
+                            if None == _has_alpha(line):
+                                continue
+
+                            if -1 != line.find('(exclusive)'):
+                                continue
+
+                            raw_level, raw_time, raw_calls, name = import_label(line)
+
+                            level = int(raw_level) - root_level+1
+                            if level == self.level_min:
+                                break
+
+                            # call_path holds the (level, id) pairs of the calls leading to the current
+                            # line, such that the parent is the deepest call above the current level
+                            while len(call_path) > 1 and call_path[-1][0] >= level:
+                                call_path.pop()
+                            parent_id = call_path[-1][1]
+
+                            if level > self.level_max:
+                                self.level_max = level
+
+                            node_id += 1
+                            call_path.append((level, node_id))
+
+                            parent_label = self[parent_id].label
+                            time = float(raw_time)/root_time if is_time(raw_time) else parent_label.time
+                            calls = float(raw_calls) if is_calls(raw_calls) else parent_label.calls
 
-                if not is_calls(label['calls']):
-                    label['calls'] = self[parent_id].label['calls']
+                            if calls > self.calls_max:
+                                self.calls_max = calls
 
-                calls = float(label['calls'])
-                if calls > self.calls_max:
-                    self.calls_max = calls
-                        
-                self.add_node(ids[-1], label, parent_id)
+                            self.add_node(node_id, Label(level, time, calls, name), parent_id)
 
-        fin.close()
+        self._finalize()
 
 
     
@@ -29,30 +29,16 @@ limitations under the License.
 """
 
 class Node:
+    __slots__ = ('identifier', 'label', 'parent', 'children')
+
     def __init__(self, identifier, label, parent):
-        self.__identifier = identifier
-        self.__label = label
-        self.__parent = parent
-        self.__children = []
-        
-    @property
-    def identifier(self):
-        return self.__identifier
-    
-    @property
-    def label(self):
-        return self.__label
-
-    @property
-    def parent(self):
-        return self.__parent
-    
-    @property
-    def children(self):
-        return self.__children
+        self.identifier = identifier
+        self.label = label
+        self.parent = parent
+        self.children = []
 
     def add_child(self, identifier):
-        self.__children.append(identifier)
+        self.children.append(identifier)
 
     def display(self):
-        print(self.__label)
+        print(self.label)
@@ -27,6 +27,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from collections import deque
 from node import Node
 
 (_ROOT, _DEPTH, _BREADTH) = range(3)
@@ -50,29 +51,33 @@ class Tree:
         return node
     
     def display(self, identifier, depth=_ROOT):
-        children = self[identifier].children
-        if depth == _ROOT:
-            print('{0}'.format(identifier) + ': {0}'.format(self[identifier].label))
-        else:
-            print('  '*depth + '{0}'.format(identifier) + ': {0}'.format(self[identifier].label))
+        # Iterative, depth-first, such that deep trees cannot exhaust the stack
+        stack = [(identifier, depth)]
+        while stack:
+            identifier, depth = stack.pop()
+            if depth == _ROOT:
+                print('{0}'.format(identifier) + ': {0}'.format(self[identifier].label))
+            else:
+                print('  '*depth + '{0}'.format(identifier) + ': {0}'.format(self[identifier].label))
 
-        depth += 1
-        for child in children:
-            self.display(child, depth)  # recursive call
+            stack.extend((child, depth+1) for child in reversed(self[identifier].children))
 
     def traverse(self, identifier, mode=_DEPTH):
         # Python generator. Loosly based on an algorithm from 
         # 'Essential LISP' by John R. Anderson, Albert T. Corbett, 
         # and Brian J. Reiser, page 239-241
-        yield self[identifier]
-        queue = self[identifier].children
-        while queue:
-            yield self[queue[0]]
-            expansion = self[queue[0]].children
-            if mode == _DEPTH:
-                queue = expansion + queue[1:]  # depth-first
-            elif mode == _BREADTH:
-                queue = queue[1:] + expansion  # width-first
+        if mode == _BREADTH:
+            queue = deque([identifier])
+            while queue:
+                node = self[queue.popleft()]
+                yield node
+                queue.extend(node.children)  # width-first
+        else:
+            stack = [identifier]
+            while stack:
+                node = self[stack.pop()]
+                yield node
+                stack.extend(reversed(node.children))  # depth-first
 
     def __getitem__(self, key):
         return self.__nodes[key]